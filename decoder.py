@@ -1,10 +1,40 @@
-from __future__ import (absolute_import, division, print_function,
-                        unicode_literals)
-from future.builtins import *  # NOQA
-from future.utils import native_str, PY2
-from struct import unpack
+from struct import Struct
 import string
-import math
+
+import numpy as np
+
+try:
+    from decoder_numba import decode_headers as _decode_headers, FIELD_TYPES as _FIELD_TYPES
+    from decoder_numba import decode_and_scale as _decode_and_scale
+except ImportError:
+    _decode_headers = None
+    _decode_and_scale = None
+
+try:
+    from decoder_c import parse_trace_header as _parse_trace_header
+except ImportError:
+    _parse_trace_header = None
+
+# weights 2^-k of the bits of binary fractions of up to 8 bytes
+_FRACTION_WEIGHTS = 2.0 ** -np.arange(1, 65)
+
+_F32 = Struct('>f')
+_F64 = Struct('>d')
+# binary fields of the 20-byte trace header, 24-bit ints as a byte and a short
+_TRACEH_BIN = Struct('>6xBHBBBHBBxBH')
+
+_PRINTABLE_SET = frozenset(string.printable.encode('ascii'))
+# bytes dropped from ascii fields
+_ASC_NON_PRINTABLE = bytes(c for c in range(256) if c not in _PRINTABLE_SET)
+
+# struct codes of the (type, length) fields Decoder.compile_schema reads with one struct
+_STRUCT_CODES = {
+    ('bin', 1): 'B', ('bin', 2): 'H', ('bin', 3): 'BH', ('bin', 4): 'I', ('bin', 8): 'Q',
+    ('bool', 1): 'B', ('bool', 2): 'H', ('bool', 4): 'I',
+    ('fraction', 1): 'B', ('fraction', 2): 'H', ('fraction', 4): 'I',
+    ('flt', 4): 'f',
+    ('dbl', 8): 'd',
+}
 
 
 class Decoder:
@@ -24,15 +54,11 @@ class Decoder:
     def bcd(byte):
         """Decode 1-byte binary code decimals."""
 
-        if isinstance(byte, (native_str, str)):
-            try:
-                byte = ord(byte)
-            except TypeError:
+        if isinstance(byte, (bytes, bytearray)):
+            if len(byte) != 1:
                 raise ValueError('not a byte')
-        elif isinstance(byte, int):
-            if byte > 255:
-                raise ValueError('not a byte')
-        else:
+            byte = byte[0]
+        elif not isinstance(byte, int) or byte > 255:
             raise ValueError('not a byte')
         v1 = byte >> 4
         v2 = byte & 0xF
@@ -41,76 +67,238 @@ class Decoder:
     @staticmethod
     def decode_bcd(bytes_in):
         """Decode arbitrary length binary code decimals."""
-        v = 0
         if isinstance(bytes_in, int):
-            bytes_in = bytes([bytes_in])
-        n = len(bytes_in)
-        n = n * 2 - 1  # 2 values per byte
+            if bytes_in > 255:
+                raise ValueError('not a byte')
+            return (bytes_in >> 4) * 10 + (bytes_in & 0xF)
+        v = 0
         for byte in bytes_in:
-            v1, v2 = Decoder.bcd(byte)
-            v += v1 * 10 ** n + v2 * 10 ** (n - 1)
-            n -= 2
+            v = v * 100 + (byte >> 4) * 10 + (byte & 0xF)
         return v
 
+    @staticmethod
+    def decode_bcd_array(a):
+        """Decode the binary code decimals of each row of the 2D uint8 array a."""
+        a = a.astype(np.int64)
+        digits = (a >> 4) * 10 + (a & 0xF)
+        return digits @ (100 ** np.arange(a.shape[1] - 1, -1, -1, dtype=np.int64))
+
     @staticmethod
     def decode_bin(bytes_in):
         """Decode unsigned ints."""
         if isinstance(bytes_in, int):
-            bytes_in = bytes([bytes_in])
-        ll = len(bytes_in)
-        # zero-pad to 4 bytes
-        b = (chr(0) * (4 - ll)).encode()
-        b += bytes_in
-        return unpack('>I', b)[0]
+            return bytes_in
+        return int.from_bytes(bytes_in, 'big')
 
     @staticmethod
     def decode_bin_bool(bytes_in):
         """Decode unsigned ints as booleans."""
-        b = Decoder.decode_bin(bytes_in)
-        return b > 0
+        if isinstance(bytes_in, int):
+            return bytes_in > 0
+        # any non-zero byte makes the value positive
+        return any(bytes_in)
 
     @staticmethod
     def decode_fraction(bytes_in):
         """Decode positive binary fractions."""
-        if PY2:
-            # transform bytes_in to a list of ints
-            bytes_ord = map(ord, bytes_in)
-        else:
-            # in PY3 this is already the case
-            bytes_ord = bytes_in
-        bit = ''.join('{:08b}'.format(b) for b in bytes_ord)
-        return sum(int(x) * 2 ** -n for n, x in enumerate(bit, 1))
+        # bit k contributes 2^-k, i.e. the whole field is an integer scaled by 2^-(8 * n)
+        return int.from_bytes(bytes_in, 'big') / float(1 << (8 * len(bytes_in)))
+
+    @staticmethod
+    def decode_fraction_array(buf):
+        """
+        Decode positive binary fractions from the rows of a 2D uint8 array.
+
+        Unpacks the bits of all rows at once and weighs them by 2^-k in one matrix
+        product; rows of up to 8 bytes are supported.
+        """
+        buf = np.asarray(buf, dtype=np.uint8)
+        if buf.ndim == 1:
+            buf = buf.reshape(1, -1)
+        bits = np.unpackbits(buf, axis=1)
+        return bits @ _FRACTION_WEIGHTS[:bits.shape[1]]
 
     @staticmethod
     def decode_flt(bytes_in):
-        """Decode single-precision floats."""
+        """Decode single-precision floats, NaN is returned as float('nan')."""
         if isinstance(bytes_in, int):
             bytes_in = bytes([bytes_in])
         ll = len(bytes_in)
-        # zero-pad to 4 bytes
-        b = (chr(0) * (4 - ll)).encode()
-        b += bytes_in
-        f = unpack('>f', b)[0]
-        if math.isnan(f):
-            f = None
-        return f
+        if ll != 4:
+            # zero-pad to 4 bytes
+            bytes_in = bytes(4 - ll) + bytes_in
+        return _F32.unpack(bytes_in)[0]
+
+    @staticmethod
+    def decode_flt_array(buf, n=None, offset=0):
+        """
+        Decode an array of single-precision floats starting at offset in buf.
+
+        The result owns its memory, so buf may be released afterwards.
+        """
+        a = np.frombuffer(buf, dtype=np.dtype('>f4'), count=-1 if n is None else n, offset=offset)
+        return a.astype(np.float32, copy=True)
+
+    @staticmethod
+    def decode_and_scale(buf, gain, n=None, offset=0):
+        """
+        Decode an array of single-precision floats starting at offset in buf, multiplied by gain.
+
+        Decoding and scaling are fused in a single pass when Numba is installed.
+        """
+        if _decode_and_scale is None:
+            out = Decoder.decode_flt_array(buf, n, offset)
+            out *= gain
+            return out
+        raw = np.frombuffer(buf, dtype=np.uint8, count=-1 if n is None else 4 * n, offset=offset)
+        out = np.empty(raw.size // 4, dtype=np.float32)
+        _decode_and_scale(raw, np.float32(gain), out)
+        return out
 
     @staticmethod
     def decode_dbl(bytes_in):
         """Decode double-precision floats."""
-        return unpack('>d', bytes_in)[0]
+        return _F64.unpack(bytes_in)[0]
 
     @staticmethod
     def decode_asc(bytes_in):
         """Decode ascii."""
-        if PY2:
-            # transform bytes_in to a list of ints
-            bytes_ord = map(ord, bytes_in)
-        else:
-            # in PY3 this is already the case
-            bytes_ord = bytes_in
-        printable = map(ord, string.printable)
-        s = ''.join(chr(x) for x in bytes_ord if x in printable)
+        s = bytes_in.translate(None, _ASC_NON_PRINTABLE).decode('ascii')
         if not s:
             s = None
         return s
+
+    @staticmethod
+    def decode_headers(buf, fields):
+        """
+        Decode the same fields from many headers at once.
+
+        buf is a 2D uint8 array with one header per row, fields is a sequence of
+        (offset, length, type) with type one of 'bin', 'bcd', 'fraction', 'flt', 'dbl'.
+        Returns (out_int, out_flt) arrays of shape (n_headers, n_fields): 'bin' and 'bcd'
+        fields are set in out_int, the others in out_flt. out_int is int64, so 'bin' fields
+        are limited to 7 bytes and 'bcd' fields to 9 bytes, longer ones raise ValueError.
+        Uses the Numba kernel when Numba is installed.
+        """
+        for off, ln, typ in fields:
+            if (typ == 'bin' and ln > 7) or (typ == 'bcd' and ln > 9):
+                raise ValueError('{} field of {} bytes does not fit in int64'.format(typ, ln))
+        buf = np.asarray(buf, dtype=np.uint8)
+        if buf.ndim == 1:
+            buf = buf.reshape(1, -1)
+        out_int = np.zeros((buf.shape[0], len(fields)), dtype=np.int64)
+        out_flt = np.zeros((buf.shape[0], len(fields)), dtype=np.float64)
+        if _decode_headers is not None:
+            offsets = np.array([f[0] for f in fields], dtype=np.int64)
+            lengths = np.array([f[1] for f in fields], dtype=np.int64)
+            types = np.array([_FIELD_TYPES[f[2]] for f in fields], dtype=np.int64)
+            _decode_headers(buf, offsets, lengths, types, out_int, out_flt)
+            return out_int, out_flt
+        # one vectorized decode per field over the byte columns of all headers
+        for j, (off, ln, typ) in enumerate(fields):
+            col = buf[:, off:off + ln]
+            if typ == 'bcd':
+                out_int[:, j] = Decoder.decode_bcd_array(col)
+            elif typ in ('flt', 'dbl'):
+                # signalling NaN bytes warn when cast, they are kept as NaN like in the kernel
+                with np.errstate(invalid='ignore'):
+                    values = np.ascontiguousarray(col).view(np.dtype('>f4' if typ == 'flt' else '>f8'))[:, 0]
+                    out_flt[:, j] = values.astype(np.float64)
+            elif typ == 'fraction':
+                out_flt[:, j] = Decoder.decode_fraction_array(col)
+            else:
+                out_int[:, j] = col.astype(np.int64) @ (256 ** np.arange(ln - 1, -1, -1, dtype=np.int64))
+        return out_int, out_flt
+
+    @staticmethod
+    def parse_trace_header(buf, off=0):
+        """
+        Decode the 20-byte trace header starting at off in buf.
+
+        Returns a tuple of (file_number, scan_type_number, channel_set_number,
+        trace_number, first_timing_word_in_ms, trace_header_extension, sample_skew,
+        trace_edit, time_break_window, extended_channel_set_number,
+        extended_file_number). Uses the compiled decoder_c extension when built.
+        """
+        if _parse_trace_header is not None:
+            return _parse_trace_header(buf, off)
+        b = bytes(buf[off:off + 20])
+        if len(b) < 20:
+            raise ValueError('buffer too short for a trace header')
+        ftw_hi, ftw_lo, the, skew, edit, tbw, tbw_frac, ecsn, efn_hi, efn_lo = _TRACEH_BIN.unpack(b)
+        return (Decoder.decode_bcd(b[0:2]),
+                Decoder.decode_bcd(b[2:3]),
+                Decoder.decode_bcd(b[3:4]),
+                Decoder.decode_bcd(b[4:6]),
+                (ftw_hi << 16 | ftw_lo) * 1. / 256,
+                the,
+                skew,
+                edit,
+                tbw + tbw_frac / 100.,
+                ecsn,
+                efn_hi << 16 | efn_lo)
+
+    @staticmethod
+    def compile_schema(fields):
+        """
+        Compile a fixed header layout into a decoding function.
+
+        fields is a sequence of (offset, length, type) with type one of 'bin', 'bool',
+        'bcd', 'fraction', 'flt', 'dbl', 'asc'. The returned function takes the header
+        buffer and returns a tuple of the decoded fields, decoded by straight-line code
+        generated for this exact layout: all fixed-width binary and float fields are read
+        by a single precompiled struct, the others are decoded field by field.
+        """
+        # fields read by the struct, in offset order
+        fmt = '>'
+        pos = 0
+        n_items = 0
+        items = {}
+        for i, (off, ln, typ) in sorted(enumerate(fields), key=lambda f: f[1][0]):
+            codes = _STRUCT_CODES.get((typ, ln))
+            if codes is None or off < pos:
+                continue
+            fmt += 'x' * (off - pos) + codes
+            pos = off + ln
+            items[i] = n_items
+            n_items += len(codes)
+        exprs = []
+        for i, (off, ln, typ) in enumerate(fields):
+            end = off + ln
+            k = items.get(i)
+            if k is not None:
+                if ln == 3:
+                    # 24-bit ints are read as a byte and a short
+                    expr = '(v[%d] << 16 | v[%d])' % (k, k + 1)
+                else:
+                    expr = 'v[%d]' % k
+                if typ == 'bool':
+                    expr += ' != 0'
+                elif typ == 'fraction':
+                    expr += ' / %r' % float(1 << (8 * ln))
+            elif typ == 'bin':
+                expr = "int.from_bytes(buf[%d:%d], 'big')" % (off, end)
+            elif typ == 'bool':
+                expr = 'any(buf[%d:%d])' % (off, end)
+            elif typ == 'bcd':
+                expr = '_bcd(buf[%d:%d])' % (off, end)
+            elif typ == 'fraction':
+                expr = "int.from_bytes(buf[%d:%d], 'big') / %r" % (off, end, float(1 << (8 * ln)))
+            elif typ == 'flt':
+                expr = '_flt(buf[%d:%d])' % (off, end)
+            elif typ == 'dbl':
+                expr = '_F64.unpack_from(buf, %d)[0]' % off
+            elif typ == 'asc':
+                expr = '_asc(buf[%d:%d])' % (off, end)
+            else:
+                raise ValueError('unknown field type: {}'.format(typ))
+            exprs.append(expr)
+        src = 'def decode(buf):\n'
+        if items:
+            src += '    v = _struct.unpack_from(buf)\n'
+        src += '    return ({}{})\n'.format(', '.join(exprs), ',' if len(exprs) == 1 else '')
+        namespace = {'_bcd': Decoder.decode_bcd, '_flt': Decoder.decode_flt,
+                     '_asc': Decoder.decode_asc, '_struct': Struct(fmt),
+                     '_F64': _F64}
+        exec(compile(src, '<schema>', 'exec'), namespace)
+        return namespace['decode']
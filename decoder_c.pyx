@@ -0,0 +1,45 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Cython decoders reading fields straight from a buffer, without slicing.
+
+Build in place with: cythonize -i decoder_c.pyx
+"""
+
+from libc.stdint cimport uint8_t, uint32_t, int64_t
+
+
+cdef inline uint32_t decode_bin_c(const uint8_t* p, int n) nogil:
+    """Decode big-endian unsigned ints of up to 4 bytes."""
+    cdef uint32_t v = 0
+    cdef int k
+    for k in range(n):
+        v = (v << 8) | p[k]
+    return v
+
+
+cdef inline int64_t decode_bcd_c(const uint8_t* p, int n) nogil:
+    """Decode binary code decimals."""
+    cdef int64_t v = 0
+    cdef int k
+    for k in range(n):
+        v = v * 100 + (p[k] >> 4) * 10 + (p[k] & 0xF)
+    return v
+
+
+def parse_trace_header(const uint8_t[::1] buf, Py_ssize_t off=0):
+    """Decode the 20-byte trace header starting at off, see Decoder.parse_trace_header."""
+    cdef const uint8_t* p
+    if off < 0 or buf.shape[0] - off < 20:
+        raise ValueError('buffer too short for a trace header')
+    p = &buf[off]
+    return (decode_bcd_c(p, 2),
+            decode_bcd_c(p + 2, 1),
+            decode_bcd_c(p + 3, 1),
+            decode_bcd_c(p + 4, 2),
+            decode_bin_c(p + 6, 3) * 1. / 256,
+            decode_bin_c(p + 9, 1),
+            decode_bin_c(p + 10, 1),
+            decode_bin_c(p + 11, 1),
+            decode_bin_c(p + 12, 2) + decode_bin_c(p + 14, 1) / 100.,
+            decode_bin_c(p + 15, 1),
+            decode_bin_c(p + 17, 3))
@@ -0,0 +1,87 @@
+# -*- coding: utf8 -*-
+"""
+Numba kernels for batch decoding of SEG-D header fields.
+"""
+
+import numpy as np
+from numba import njit, prange
+
+# field type codes of the header descriptors
+BIN = 0
+BCD = 1
+FRACTION = 2
+FLT = 3
+DBL = 4
+
+FIELD_TYPES = {'bin': BIN, 'bcd': BCD, 'fraction': FRACTION, 'flt': FLT, 'dbl': DBL}
+
+# samples decoded per thread work item by decode_and_scale
+SAMPLES_CHUNK = 4096
+
+
+@njit(cache=True, parallel=True)
+def decode_headers(buf, offsets, lengths, types, out_int, out_flt):
+    """
+    Decode header fields of every row of buf in parallel.
+
+    buf is a 2D uint8 array with one header per row, the fields are described by
+    the offsets, lengths and types arrays. Integer fields (BIN, BCD) are written to
+    out_int, floating point fields (FRACTION, FLT, DBL) to out_flt; both outputs have
+    shape (n_headers, n_fields). out_int is int64: BIN fields of more than 7 bytes and
+    BCD fields of more than 9 bytes overflow, Decoder.decode_headers rejects them.
+    """
+    n_fields = offsets.shape[0]
+    for i in prange(buf.shape[0]):
+        # scratch words to reinterpret big-endian integers as IEEE floats
+        u32 = np.empty(1, dtype=np.uint32)
+        f32 = u32.view(np.float32)
+        u64 = np.empty(1, dtype=np.uint64)
+        f64 = u64.view(np.float64)
+        for j in range(n_fields):
+            off = offsets[j]
+            ln = lengths[j]
+            t = types[j]
+            if t == BCD:
+                v = 0
+                for k in range(ln):
+                    b = buf[i, off + k]
+                    v = v * 100 + (b >> 4) * 10 + (b & 0xF)
+                out_int[i, j] = v
+            elif t == DBL:
+                w = np.uint64(0)
+                for k in range(ln):
+                    w = (w << np.uint64(8)) | np.uint64(buf[i, off + k])
+                u64[0] = w
+                out_flt[i, j] = f64[0]
+            else:
+                v = 0
+                for k in range(ln):
+                    v = (v << 8) | buf[i, off + k]
+                if t == BIN:
+                    out_int[i, j] = v
+                elif t == FRACTION:
+                    out_flt[i, j] = v / 2.0 ** (8 * ln)
+                elif t == FLT:
+                    u32[0] = v
+                    out_flt[i, j] = f32[0]
+
+
+@njit(cache=True, parallel=True)
+def decode_and_scale(buf, gain, out):
+    """
+    Decode big-endian single-precision floats from the uint8 buf and multiply them by gain.
+
+    Each sample is assembled, reinterpreted and scaled in one pass, writing to the
+    float32 array out. Threads work on chunks of SAMPLES_CHUNK samples.
+    """
+    n = out.shape[0]
+    for c in prange((n + SAMPLES_CHUNK - 1) // SAMPLES_CHUNK):
+        start = c * SAMPLES_CHUNK
+        chunk = out[start:min(start + SAMPLES_CHUNK, n)]
+        # the float32 samples reinterpreted as words, to be set from the big-endian bytes
+        bits = chunk.view(np.uint32)
+        for i in range(chunk.shape[0]):
+            j = 4 * (start + i)
+            bits[i] = (np.uint32(buf[j]) << 24) | (np.uint32(buf[j + 1]) << 16) | \
+                (np.uint32(buf[j + 2]) << 8) | np.uint32(buf[j + 3])
+            chunk[i] *= gain
@@ -3,29 +3,238 @@
 SEG-D modified Parser based on ObsPy core module.
 """
 
-from __future__ import (absolute_import, division, print_function,
-                        unicode_literals)
-
-import ast
-import ntpath
+import mmap
 import os
-import sys
 from pathlib import Path
 from typing import List
 
-from future.builtins import *  # NOQA
-from future.utils import PY2
-
 from collections import OrderedDict
-from struct import unpack
-from array import array
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from struct import Struct
 
 import numpy as np
 from obspy import UTCDateTime, Trace, Stream
-from typing.io import BinaryIO
 
 from decoder import Decoder
 
+# decoders called by the header readers, bound once instead of looked up on Decoder per field
+_bcd = Decoder.decode_bcd
+_bcd_nibbles = Decoder.bcd
+_asc = Decoder.decode_asc
+
+
+# binary fields of the header blocks, 24-bit ints are read as a byte and a short
+# general header #2: expanded file number, external header blocks, revision,
+# general trailer blocks, extended record length, general header block number
+_GH2_BIN = Struct('>BH4xHxBBHBHxB')
+# general header #3: expanded file number, source line number and fraction,
+# source point number and fraction, phase control, vibrator type, phase angle,
+# general header block number, source set number
+_GH3_BIN = Struct('>BHBHHBHHxBBHBB')
+# scan type header: channel set start and end times, vertical stack,
+# streamer cable number, array forming
+_SCH_BIN = Struct('>2xHH23xBBB')
+_EMPTY_SCH = bytes(32)
+
+# bytes of the file read in ahead when it is opened
+_PREFETCH_SIZE = 64 << 20
+# SERCEL extended header, bytes 0-875
+_EXTDH_BIN = Struct('>10If25I32I32II80xII4x4I2fI16sI16s12s2df3I160s4I64sI4x3I4x2I')
+
+# fields of the trace header, in the order of Decoder.parse_trace_header
+_TRACEH_KEYS = ('file_number', 'scan_type_number', 'channel_set_number', 'trace_number',
+                'first_timing_word_in_ms', 'trace_header_extension', 'sample_skew', 'trace_edit',
+                'time_break_window', 'extended_channel_set_number', 'extended_file_number')
+
+# fields of the trace header for Decoder.decode_headers, first_timing_word_in_ms is in
+# 1/256 ms and time_break_window has a separate fraction byte
+_TRACEH_FIELDS = (
+    ('file_number', 0, 2, 'bcd'),
+    ('scan_type_number', 2, 1, 'bcd'),
+    ('channel_set_number', 3, 1, 'bcd'),
+    ('trace_number', 4, 2, 'bcd'),
+    ('first_timing_word_in_ms', 6, 3, 'bin'),
+    ('trace_header_extension', 9, 1, 'bin'),
+    ('sample_skew', 10, 1, 'bin'),
+    ('trace_edit', 11, 1, 'bin'),
+    ('time_break_window', 12, 2, 'bin'),
+    ('time_break_window_fraction', 14, 1, 'bin'),
+    ('extended_channel_set_number', 15, 1, 'bin'),
+    ('extended_file_number', 17, 3, 'bin'),
+)
+
+
+def _compile_fields(fields):
+    """Compile a table of (key, offset, length, type) fields into (keys, decoder)."""
+    return tuple(f[0] for f in fields), Decoder.compile_schema([f[1:] for f in fields])
+
+
+# trace header extension blocks
+# block #1, SEGD standard
+_TRACEH_EB1_FIELDS = (
+    ('receiver_line_number', 0, 3, 'bin'),
+    ('receiver_point_number', 3, 3, 'bin'),
+    ('receiver_point_index', 6, 1, 'bin'),
+    ('number_of_samples_per_trace', 7, 3, 'bin'),
+)
+_TRACEH_EB1_KEYS, _decode_traceh_eb1 = _compile_fields(_TRACEH_EB1_FIELDS)
+
+# block #2, SERCEL format
+_TRACEH_EB2_FIELDS = (
+    ('receiver_point_easting', 0, 8, 'dbl'),
+    ('receiver_point_northing', 8, 8, 'dbl'),
+    ('receiver_point_elevation', 16, 4, 'flt'),
+    ('sensor_type_number', 20, 1, 'bin'),
+    # 21-23 : not used
+    ('DSD_identification_number', 24, 4, 'bin'),
+    ('extended_trace_number', 28, 4, 'bin'),
+)
+_TRACEH_EB2_KEYS, _decode_traceh_eb2 = _compile_fields(_TRACEH_EB2_FIELDS)
+
+# block #3, SERCEL format
+_TRACEH_EB3_FIELDS = (
+    ('resistance_low_limit', 0, 4, 'flt'),
+    ('resistance_high_limit', 4, 4, 'flt'),
+    ('resistance_calue_in_ohms', 8, 4, 'flt'),
+    ('tilt_limit', 12, 4, 'flt'),
+    ('tilt_value', 16, 4, 'flt'),
+    ('resistance_error', 20, 1, 'bool'),
+    ('tilt_error', 21, 1, 'bool'),
+    # 22-31 : not used
+)
+_TRACEH_EB3_KEYS, _decode_traceh_eb3 = _compile_fields(_TRACEH_EB3_FIELDS)
+
+# block #4, SERCEL format
+_TRACEH_EB4_FIELDS = (
+    ('capacitance_low_limit', 0, 4, 'flt'),
+    ('capacitance_high_limit', 4, 4, 'flt'),
+    ('capacitance_value_in_nano_farads', 8, 4, 'flt'),
+    ('cutoff_low_limit', 12, 4, 'flt'),
+    ('cutoff_high_limit', 16, 4, 'flt'),
+    ('cutoff_value_in_Hz', 20, 4, 'flt'),
+    ('capacitance_error', 24, 1, 'bool'),
+    ('cutoff_error', 25, 1, 'bool'),
+    # 26-31 : not used
+)
+_TRACEH_EB4_KEYS, _decode_traceh_eb4 = _compile_fields(_TRACEH_EB4_FIELDS)
+
+# block #5, SERCEL format
+_TRACEH_EB5_FIELDS = (
+    ('leakage_limit', 0, 4, 'flt'),
+    ('leakage_value_in_megahoms', 4, 4, 'flt'),
+    ('instrument_longitude', 8, 8, 'dbl'),
+    ('instrument_latitude', 16, 8, 'dbl'),
+    ('leakage_error', 24, 1, 'bool'),
+    ('instrument_horizontal_position_accuracy_in_mm', 25, 3, 'bin'),
+    ('instrument_elevation_in_mm', 28, 4, 'flt'),
+)
+_TRACEH_EB5_KEYS, _decode_traceh_eb5 = _compile_fields(_TRACEH_EB5_FIELDS)
+
+# block #6, SERCEL format
+_TRACEH_EB6_FIELDS = (
+    # 0 : unit_type
+    ('unit_serial_number', 1, 3, 'bin'),
+    ('channel_number', 4, 1, 'bin'),
+    # 5-7 : not used
+    ('assembly_type', 8, 1, 'bin'),
+    ('assembly_serial_number', 9, 3, 'bin'),
+    ('location_in_assembly', 12, 1, 'bin'),
+    # 13-15 : not used
+    # 16 : subunit_type
+    # 17 : channel_type
+    # 18-19 : not used
+    ('sensor_sensitivity_in_mV/m/s/s', 20, 4, 'flt'),
+    # 24-31 : not used
+)
+_TRACEH_EB6_KEYS, _decode_traceh_eb6 = _compile_fields(_TRACEH_EB6_FIELDS)
+
+# block #7, SERCEL format
+_TRACEH_EB7_FIELDS = (
+    # 0 : control_unit_type
+    # 1-3 : control_unit_serial_number
+    # 4 : channel_gain_scale
+    # 5 : channel_filter
+    # 6 : channel_data_error_overscaling
+    # 7 : channel_edited_status
+    # 8-11 : channel_sample_to_mV_conversion_factor
+    # 12 : number_of_stacks_noisy
+    # 13 : number_of_stacks_low
+    # 14 : channel_type_id
+    # 15 : channel_process
+    ('trace_max_value', 16, 4, 'flt'),
+    ('trace_max_time_in_us', 20, 4, 'bin'),
+    ('number_of_interpolations', 24, 4, 'bin'),
+    ('seismic_trace_offset_value', 28, 4, 'bin'),
+)
+_TRACEH_EB7_KEYS, _decode_traceh_eb7 = _compile_fields(_TRACEH_EB7_FIELDS)
+
+_TRACEH_EB_KEYS = (_TRACEH_EB1_KEYS, _TRACEH_EB2_KEYS, _TRACEH_EB3_KEYS, _TRACEH_EB4_KEYS,
+                   _TRACEH_EB5_KEYS, _TRACEH_EB6_KEYS, _TRACEH_EB7_KEYS)
+_TRACEH_EB_FIELDS = (_TRACEH_EB1_FIELDS, _TRACEH_EB2_FIELDS, _TRACEH_EB3_FIELDS, _TRACEH_EB4_FIELDS,
+                     _TRACEH_EB5_FIELDS, _TRACEH_EB6_FIELDS, _TRACEH_EB7_FIELDS)
+
+
+# decoded trace header + trace header extensions #1 ... #7, one record per trace
+TRACE_HEADER_DTYPE = np.dtype([
+    ('file_number', 'u2'),
+    ('scan_type_number', 'u1'),
+    ('channel_set_number', 'u1'),
+    ('trace_number', 'u2'),
+    ('first_timing_word_in_ms', 'f8'),
+    ('trace_header_extension', 'u1'),
+    ('sample_skew', 'u1'),
+    ('trace_edit', 'u1'),
+    ('time_break_window', 'f8'),
+    ('extended_channel_set_number', 'u1'),
+    ('extended_file_number', 'u4'),
+    ('receiver_line_number', 'u4'),
+    ('receiver_point_number', 'u4'),
+    ('receiver_point_index', 'u1'),
+    ('number_of_samples_per_trace', 'u4'),
+    ('receiver_point_easting', 'f8'),
+    ('receiver_point_northing', 'f8'),
+    ('receiver_point_elevation', 'f4'),
+    ('sensor_type_number', 'u1'),
+    ('DSD_identification_number', 'u4'),
+    ('extended_trace_number', 'u4'),
+    ('resistance_low_limit', 'f4'),
+    ('resistance_high_limit', 'f4'),
+    ('resistance_calue_in_ohms', 'f4'),
+    ('tilt_limit', 'f4'),
+    ('tilt_value', 'f4'),
+    ('resistance_error', '?'),
+    ('tilt_error', '?'),
+    ('capacitance_low_limit', 'f4'),
+    ('capacitance_high_limit', 'f4'),
+    ('capacitance_value_in_nano_farads', 'f4'),
+    ('cutoff_low_limit', 'f4'),
+    ('cutoff_high_limit', 'f4'),
+    ('cutoff_value_in_Hz', 'f4'),
+    ('capacitance_error', '?'),
+    ('cutoff_error', '?'),
+    ('leakage_limit', 'f4'),
+    ('leakage_value_in_megahoms', 'f4'),
+    ('instrument_longitude', 'f8'),
+    ('instrument_latitude', 'f8'),
+    ('leakage_error', '?'),
+    ('instrument_horizontal_position_accuracy_in_mm', 'u4'),
+    ('instrument_elevation_in_mm', 'f4'),
+    ('unit_serial_number', 'u4'),
+    ('channel_number', 'u1'),
+    ('assembly_type', 'u1'),
+    ('assembly_serial_number', 'u4'),
+    ('location_in_assembly', 'u1'),
+    ('sensor_sensitivity_in_mV/m/s/s', 'f4'),
+    ('trace_max_value', 'f4'),
+    ('trace_max_time_in_us', 'u4'),
+    ('number_of_interpolations', 'u4'),
+    ('seismic_trace_offset_value', 'u4'),
+])
+# raw values stored for the trace header fields decoded as None
+_TRACEH_UNDEFINED = {'file_number': 0xFFFF, 'receiver_line_number': 0xFFFFFF,
+                     'receiver_point_number': 0xFFFFFF}
+
 
 class SEGDNotImplemented(Exception):
     pass
@@ -35,14 +244,47 @@ class SEGDScanTypeError(Exception):
     pass
 
 
+@lru_cache(maxsize=None)
+def _trace_headers_reader(th_ext):
+    """
+    Compile the reader of a trace header followed by th_ext extension blocks.
+
+    The returned function takes the parser, reads the whole trace header from it and returns
+    the decoded dict, with the extension block decoders called in straight-line code.
+    """
+    if th_ext > len(_TRACEH_EB_KEYS):
+        raise SEGDNotImplemented('Only trace header extension blocks #1 ... #7 are supported')
+    size = 20 + 32 * th_ext
+    keys = _TRACEH_KEYS + sum(_TRACEH_EB_KEYS[:th_ext], ())
+    src = 'def read_trace_headers(parser):\n'
+    src += '    buf = parser._read(%d)\n' % size
+    src += '    parser.traceh_list.append(bytearray(buf))\n'
+    src += '    traceh = OrderedDict(zip(_TRACEH_KEYS, _parse_trace_header(buf)))\n'
+    for n in range(th_ext):
+        off = 20 + 32 * n
+        src += '    traceh.update(zip(_TRACEH_EB%d_KEYS, _decode_traceh_eb%d(buf[%d:%d])))\n' % (
+            n + 1, n + 1, off, off + 32)
+    for key, val in _TRACEH_UNDEFINED.items():
+        if key in keys:
+            src += '    if traceh[%r] == %d:\n' % (key, val)
+            src += '        traceh[%r] = None\n' % key
+    src += '    return traceh\n'
+    namespace = dict(globals(), _parse_trace_header=Decoder.parse_trace_header)
+    exec(compile(src, '<trace headers>', 'exec'), namespace)
+    return namespace['read_trace_headers']
+
+
 class SegDParser:
     """
-    SegDParser(segd_path : str)
+    SegDParser(segd_path : str, gain : float = None, sample_dtype : str = 'float32')
         Seg-D files parser. Call read_segd() to execute.
 
         Parameters
         ----------
         segd_path : path to Seg-D file
+        gain : optional factor the trace samples are multiplied by while they are decoded
+        sample_dtype : 'float32' to keep the decoded samples, or 'int16' to store them quantized
+            with one gain per trace, halving the memory of traces_data
 
         Attributes
         ----------
@@ -53,69 +295,100 @@ class SegDParser:
         traceh_list : List[bytearray]
             Bytearrays of trace header + trace header extensions #1 ... #7 for each trace
 
+        traceh : np.recarray
+            Decoded trace headers of dtype TRACE_HEADER_DTYPE, one record per trace. Fields of
+            extensions missing from a trace are 0, undefined (None) integers keep their raw all-ones
+            value. get_traceh(i) returns the header of trace i as a dict
+
         traces_data : np.ndarray
-            2D array of shape(num_of_traces, num_of_samples) containing amplitude values in float
+            2D array of shape(num_of_traces, num_of_samples) containing amplitude values in float32,
+            in int32 when all samples of the file are integral, or in int16 when sample_dtype is
+            'int16'
+
+        trace_gains : np.ndarray
+            float32 gain of each trace when sample_dtype is 'int16', the amplitudes of trace i are
+            traces_data[i] * trace_gains[i], see decoded_trace()
+
+        The merged header of trace i is built on request by segd_header(i), to_stream() returns the
+        traces as an ObsPy Stream with this header in their segd stats.
     """
-    _byte_stream: BinaryIO
+    _mm: mmap.mmap
+    _pos: int
     traces_data: np.ndarray
+    trace_gains: np.ndarray
+    traceh: np.recarray
     traceh_list: List[bytearray]
     header_block: bytearray
+    _header_chunks: List[bytes]
     _segd_dir: str
     _segd_filename: str
     _output_dir: str
+    _stem: str
 
-    def __init__(self, segd_path: str):
+    def __init__(self, segd_path: str, gain: float = None, sample_dtype: str = 'float32'):
+        if sample_dtype not in ('float32', 'int16'):
+            raise ValueError('sample_dtype must be float32 or int16')
         self._filepath = segd_path
+        self._gain = gain
+        self._sample_dtype = sample_dtype
         self.header_block = bytearray(b'')
         self.traceh_list = []
+        # raw blocks of the header block, joined once complete
+        self._header_chunks = []
+
+    def _read(self, n):
+        """Return the next n bytes of the mapped file and advance the cursor."""
+        p = self._pos
+        self._pos = p + n
+        return self._mm[p:p + n]
 
     def _read_general_hdr1(self):
         """Read general header block #1."""
-        buf = self._byte_stream.read(32)
-        self.header_block.extend(bytearray(buf))
+        buf = self._read(32)
+        self._header_chunks.append(buf)
 
         general_hdr1 = OrderedDict()
-        general_hdr1['file_number'] = Decoder.decode_bcd(buf[0:2])
-        _format_code = Decoder.decode_bcd(buf[2:4])
+        general_hdr1['file_number'] = _bcd(buf[0:2])
+        _format_code = _bcd(buf[2:4])
         if _format_code != 8058:
             raise SEGDNotImplemented('Only 32 bit IEEE demultiplexed data '
                                      'is currently supported')
-        general_hdr1['format_code'] = Decoder.decode_bcd(buf[2:4])
-        general_hdr1['general_constants'] = [Decoder.decode_bcd(b) for b in buf[4:10]]  # unsure
-        _year = Decoder.decode_bcd(buf[10:11]) + 2000
-        _nblocks, _jday = Decoder.bcd(buf[11])
+        general_hdr1['format_code'] = _format_code
+        general_hdr1['general_constants'] = [_bcd(b) for b in buf[4:10]]  # unsure
+        _year = _bcd(buf[10:11]) + 2000
+        _nblocks, _jday = _bcd_nibbles(buf[11])
         general_hdr1['n_additional_blocks'] = _nblocks
         _jday *= 100
-        _jday += Decoder.decode_bcd(buf[12:13])
-        _hour = Decoder.decode_bcd(buf[13:14])
-        _min = Decoder.decode_bcd(buf[14:15])
-        _sec = Decoder.decode_bcd(buf[15:16])
+        _jday += _bcd(buf[12:13])
+        _hour = _bcd(buf[13:14])
+        _min = _bcd(buf[14:15])
+        _sec = _bcd(buf[15:16])
         general_hdr1['time'] = UTCDateTime(year=_year, julday=_jday,
                                            hour=_hour, minute=_min, second=_sec)
-        general_hdr1['manufacture_code'] = Decoder.decode_bcd(buf[16:17])
-        general_hdr1['manufacture_serial_number'] = Decoder.decode_bcd(buf[17:19])
-        general_hdr1['bytes_per_scan'] = Decoder.decode_bcd(buf[19:22])
-        _bsi = Decoder.decode_bcd(buf[22:23])
+        general_hdr1['manufacture_code'] = _bcd(buf[16:17])
+        general_hdr1['manufacture_serial_number'] = _bcd(buf[17:19])
+        general_hdr1['bytes_per_scan'] = _bcd(buf[19:22])
+        _bsi = _bcd(buf[22:23])
         if _bsi < 10:
             _bsi = 1. / _bsi
         else:
             _bsi /= 10.
         general_hdr1['base_scan_interval_in_ms'] = _bsi
-        _pol, _ = Decoder.bcd(buf[23])
+        _pol, _ = _bcd_nibbles(buf[23])
         general_hdr1['polarity'] = _pol
         # 23L-24 : not used
-        _rec_type, _rec_len = Decoder.bcd(buf[25])
+        _rec_type, _rec_len = _bcd_nibbles(buf[25])
         # general_hdr['record_type'] = record_types[_rec_type]
         _rec_len = 0x100 * _rec_len
-        _rec_len += Decoder.decode_bin(buf[26:27])
+        _rec_len += buf[26]
         if _rec_len == 0xFFF:
             _rec_len = None
         general_hdr1['record_length'] = _rec_len
-        general_hdr1['scan_type_per_record'] = Decoder.decode_bcd(buf[27:28])
-        general_hdr1['n_channel_sets_per_record'] = Decoder.decode_bcd(buf[28:29])
-        general_hdr1['n_sample_skew_32bit_extensions'] = Decoder.decode_bcd(buf[29:30])
-        general_hdr1['extended_header_length'] = Decoder.decode_bcd(buf[30:31])
-        _ehl = Decoder.decode_bcd(buf[31:32])
+        general_hdr1['scan_type_per_record'] = _bcd(buf[27:28])
+        general_hdr1['n_channel_sets_per_record'] = _bcd(buf[28:29])
+        general_hdr1['n_sample_skew_32bit_extensions'] = _bcd(buf[29:30])
+        general_hdr1['extended_header_length'] = _bcd(buf[30:31])
+        _ehl = _bcd(buf[31:32])
         # If more than 99 External Header blocks are used,
         # then this field is set to FF and General Header block #2 (bytes 8-9)
         # indicates the number of External Header blocks.
@@ -126,187 +399,178 @@ class SegDParser:
 
     def _read_general_hdr2(self):
         """Read general header block #2."""
-        buf = self._byte_stream.read(32)
-        self.header_block.extend(bytearray(buf))
+        buf = self._read(32)
+        self._header_chunks.append(buf)
 
+        (_efn_hi, _efn_lo, _ehb, _rev_major, _rev_minor, _nbgt,
+         _erl_hi, _erl_lo, _ghbn) = _GH2_BIN.unpack_from(buf)
         general_hdr2 = OrderedDict()
-        general_hdr2['expanded_file_number'] = Decoder.decode_bin(buf[0:3])
+        general_hdr2['expanded_file_number'] = _efn_hi << 16 | _efn_lo
         # 3-6 : not used
-        general_hdr2['external_header_blocks'] = Decoder.decode_bin(buf[7:9])
+        general_hdr2['external_header_blocks'] = _ehb
         # 9 : not used
-        _rev = ord(buf[10:11])
-        _rev += ord(buf[11:12]) / 10.
-        general_hdr2['segd_revision_number'] = _rev
-        general_hdr2['no_blocks_of_general_trailer'] = Decoder.decode_bin(buf[12:14])
-        general_hdr2['extended_record_length_in_ms'] = Decoder.decode_bin(buf[14:17])
+        general_hdr2['segd_revision_number'] = _rev_major + _rev_minor / 10.
+        general_hdr2['no_blocks_of_general_trailer'] = _nbgt
+        general_hdr2['extended_record_length_in_ms'] = _erl_hi << 16 | _erl_lo
         # 17 : not used
-        general_hdr2['general_header_block_number'] = Decoder.decode_bin(buf[18:19])
+        general_hdr2['general_header_block_number'] = _ghbn
         # 19-32 : not used
         return general_hdr2
 
     def _read_general_hdr3(self):
         """Read general header block #3."""
-        buf = self._byte_stream.read(32)
-        self.header_block.extend(bytearray(buf))
+        buf = self._read(32)
+        self._header_chunks.append(buf)
 
+        (_efn_hi, _efn_lo, _sln_hi, _sln_lo, _sln_frac, _spn_hi, _spn_lo, _spn_frac,
+         _pc, _vt, _pa, _ghbn, _ssn) = _GH3_BIN.unpack_from(buf)
         general_hdr3 = OrderedDict()
-        general_hdr3['expanded_file_number'] = Decoder.decode_bin(buf[0:3])
-        _sln = Decoder.decode_bin(buf[3:6])
-        _sln += Decoder.decode_fraction(buf[6:8])
-        general_hdr3['source_line_number'] = _sln
-        _spn = Decoder.decode_bin(buf[8:11])
-        _spn += Decoder.decode_fraction(buf[11:13])
-        general_hdr3['source_point_number'] = _spn
-        general_hdr3['phase_control'] = Decoder.decode_bin(buf[14:15])
-        general_hdr3['vibrator_type'] = Decoder.decode_bin(buf[15:16])
-        general_hdr3['phase_angle'] = Decoder.decode_bin(buf[16:18])
-        general_hdr3['general_header_block_number'] = Decoder.decode_bin(buf[18:19])
-        general_hdr3['source_set_number'] = Decoder.decode_bin(buf[19:20])
+        general_hdr3['expanded_file_number'] = _efn_hi << 16 | _efn_lo
+        # 2-byte binary fractions
+        general_hdr3['source_line_number'] = (_sln_hi << 16 | _sln_lo) + _sln_frac / 65536.
+        general_hdr3['source_point_number'] = (_spn_hi << 16 | _spn_lo) + _spn_frac / 65536.
+        general_hdr3['phase_control'] = _pc
+        general_hdr3['vibrator_type'] = _vt
+        general_hdr3['phase_angle'] = _pa
+        general_hdr3['general_header_block_number'] = _ghbn
+        general_hdr3['source_set_number'] = _ssn
         # 20-32 : not used
         return general_hdr3
 
     def _read_sch(self):
         """Read scan type header."""
-        buf = self._byte_stream.read(32)
-        self.header_block.extend(bytearray(buf))
+        buf = self._read(32)
+        self._header_chunks.append(buf)
 
-        # check if all the bytes are zero:
-        if PY2:
-            # convert buf to a list of ints
-            _sum = sum(map(ord, buf))
-        else:
-            # in PY3 this is already the case
-            _sum = sum(buf)
-        if _sum == 0:
+        # check if all the bytes are zero, compared in one memcmp
+        if buf == _EMPTY_SCH:
             raise SEGDScanTypeError('Empty scan type header')
+        _csst, _cset, _vs, _scn, _af = _SCH_BIN.unpack_from(buf)
         sch = OrderedDict()
-        sch['scan_type_header'] = Decoder.decode_bcd(buf[0:1])
-        sch['channel_set_number'] = Decoder.decode_bcd(buf[1:2])
-        sch['channel_set_starting_time'] = Decoder.decode_bin(buf[2:4])
-        sch['channel_set_end_time'] = Decoder.decode_bin(buf[4:6])
-        _dm = Decoder.decode_bin(buf[6:8][::-1])
+        sch['scan_type_header'] = _bcd(buf[0:1])
+        sch['channel_set_number'] = _bcd(buf[1:2])
+        sch['channel_set_starting_time'] = _csst
+        sch['channel_set_end_time'] = _cset
+        # 6-7 : descale multiplier
         # sch['descale_multiplier_in_mV'] = _descale_multiplier.get(_dm, int(str(_dm), base=16))
         # print(sch['descale_multiplier_in_mV'])
-        sch['number_of_channels'] = Decoder.decode_bcd(buf[8:10])
-        _ctid, _ = Decoder.bcd(buf[10])
+        sch['number_of_channels'] = _bcd(buf[8:10])
+        _ctid, _ = _bcd_nibbles(buf[10])
         sch['channel_type_id'] = _ctid
-        _nse, _cgcm = Decoder.bcd(buf[11])
+        _nse, _cgcm = _bcd_nibbles(buf[11])
         sch['number_of_subscans_exponent'] = _nse
         sch['channel_gain_control_method'] = _cgcm
-        sch['alias_filter_freq_at_-3dB_in_Hz'] = Decoder.decode_bcd(buf[12:14])
-        sch['alias_filter_slope_in_dB/octave'] = Decoder.decode_bcd(buf[14:16])
-        sch['low-cut_filter_freq_in_Hz'] = Decoder.decode_bcd(buf[16:18])
-        sch['low-cut_filter_slope_in_dB/octave'] = Decoder.decode_bcd(buf[18:20])
-        sch['first_notch_freq'] = Decoder.decode_bcd(buf[20:22])
-        sch['second_notch_freq'] = Decoder.decode_bcd(buf[22:24])
-        sch['third_notch_freq'] = Decoder.decode_bcd(buf[24:26])
-        sch['extended_channel_set_number'] = Decoder.decode_bcd(buf[26:28])
-        _ehf, _the = Decoder.bcd(buf[28])
+        sch['alias_filter_freq_at_-3dB_in_Hz'] = _bcd(buf[12:14])
+        sch['alias_filter_slope_in_dB/octave'] = _bcd(buf[14:16])
+        sch['low-cut_filter_freq_in_Hz'] = _bcd(buf[16:18])
+        sch['low-cut_filter_slope_in_dB/octave'] = _bcd(buf[18:20])
+        sch['first_notch_freq'] = _bcd(buf[20:22])
+        sch['second_notch_freq'] = _bcd(buf[22:24])
+        sch['third_notch_freq'] = _bcd(buf[24:26])
+        sch['extended_channel_set_number'] = _bcd(buf[26:28])
+        _ehf, _the = _bcd_nibbles(buf[28])
         sch['extended_header_flag'] = _ehf
         sch['trace_header_extensions'] = _the
-        sch['vertical_stack'] = Decoder.decode_bin(buf[29:30])
-        sch['streamer_cable_number'] = Decoder.decode_bin(buf[30:31])
-        sch['array_forming'] = Decoder.decode_bin(buf[31:32])
+        sch['vertical_stack'] = _vs
+        sch['streamer_cable_number'] = _scn
+        sch['array_forming'] = _af
         return sch
 
     def _read_extended_header(self, size):
         """Read extended header."""
-        buf = self._byte_stream.read(size)
-        self.header_block.extend(bytearray(buf))
+        buf = self._read(size)
+        self._header_chunks.append(buf)
 
+        v = _EXTDH_BIN.unpack_from(buf)
         extdh = OrderedDict()
         # SERCEL extended header format
-        extdh['acquisition_length_in_ms'] = Decoder.decode_bin(buf[0:4])
-        extdh['sample_rate_in_us'] = Decoder.decode_bin(buf[4:8])
-        extdh['total_number_of_traces'] = Decoder.decode_bin(buf[8:12])
-        extdh['number_of_auxes'] = Decoder.decode_bin(buf[12:16])
-        extdh['number_of_seis_traces'] = Decoder.decode_bin(buf[16:20])
-        extdh['number_of_dead_seis_traces'] = Decoder.decode_bin(buf[20:24])
-        extdh['number_of_live_seis_traces'] = Decoder.decode_bin(buf[24:28])
-        _tos = Decoder.decode_bin(buf[28:32])
+        extdh['acquisition_length_in_ms'] = v[0]
+        extdh['sample_rate_in_us'] = v[1]
+        extdh['total_number_of_traces'] = v[2]
+        extdh['number_of_auxes'] = v[3]
+        extdh['number_of_seis_traces'] = v[4]
+        extdh['number_of_dead_seis_traces'] = v[5]
+        extdh['number_of_live_seis_traces'] = v[6]
+        _tos = v[7]
         # extdh['type_of_source'] = _source_types.get(_tos, None)
-        num_of_samples_raw = buf[32:36]
-        num_of_samples = Decoder.decode_bin(num_of_samples_raw)
-        extdh['number_of_samples_in_trace'] = Decoder.decode_bin(buf[32:36])
-        extdh['shot_number'] = Decoder.decode_bin(buf[36:40])
-        extdh['TB_window_in_s'] = Decoder.decode_flt(buf[40:44])
-        _trt = Decoder.decode_bin(buf[44:48])
+        extdh['number_of_samples_in_trace'] = v[8]
+        extdh['shot_number'] = v[9]
+        extdh['TB_window_in_s'] = v[10]
+        _trt = v[11]
         # extdh['test_record_type'] = _test_record_types[_trt]
-        extdh['spread_first_line'] = Decoder.decode_bin(buf[48:52])
-        extdh['spread_first_number'] = Decoder.decode_bin(buf[52:56])
-        extdh['spread_number'] = Decoder.decode_bin(buf[56:60])
-        _st = Decoder.decode_bin(buf[60:64])
+        extdh['spread_first_line'] = v[12]
+        extdh['spread_first_number'] = v[13]
+        extdh['spread_number'] = v[14]
+        _st = v[15]
         # extdh['spread_type'] = _spread_types[_st]
-        extdh['time_break_in_us'] = Decoder.decode_bin(buf[64:68])
-        extdh['uphole_time_in_us'] = Decoder.decode_bin(buf[68:72])
-        extdh['blaster_id'] = Decoder.decode_bin(buf[72:76])
-        extdh['blaster_status'] = Decoder.decode_bin(buf[76:80])
-        extdh['refraction_delay_in_ms'] = Decoder.decode_bin(buf[80:84])
-        extdh['TB_to_T0_time_in_us'] = Decoder.decode_bin(buf[84:88])
-        extdh['internal_time_break'] = Decoder.decode_bin_bool(buf[88:92])
-        extdh['prestack_within_field_units'] = Decoder.decode_bin_bool(buf[92:96])
-        _net = Decoder.decode_bin(buf[96:100])
+        extdh['time_break_in_us'] = v[16]
+        extdh['uphole_time_in_us'] = v[17]
+        extdh['blaster_id'] = v[18]
+        extdh['blaster_status'] = v[19]
+        extdh['refraction_delay_in_ms'] = v[20]
+        extdh['TB_to_T0_time_in_us'] = v[21]
+        extdh['internal_time_break'] = v[22] != 0
+        extdh['prestack_within_field_units'] = v[23] != 0
+        _net = v[24]
         # extdh['noise_elimination_type'] = _noise_elimination_types.get(_net, None)
-        extdh['low_trace_percentage'] = Decoder.decode_bin(buf[100:104])
-        extdh['low_trace_value_in_dB'] = Decoder.decode_bin(buf[104:108])
-        _value1 = Decoder.decode_bin(buf[108:112])
-        _value2 = Decoder.decode_bin(buf[112:116])
+        extdh['low_trace_percentage'] = v[25]
+        extdh['low_trace_value_in_dB'] = v[26]
+        _value1 = v[27]
+        _value2 = v[28]
         if _net == 2:
             # Diversity Stack
             extdh['number_of_windows'] = _value1
         elif _net == 3:
             # Historic
             # extdh['historic_editing_type'] = _historic_editing_types[_value2]
-            extdh['historic_range'] = Decoder.decode_bin(buf[120:124])
-            extdh['historic_taper_length_2_exponent'] = Decoder.decode_bin(buf[124:128])
-            extdh['historic_threshold_init_value'] = Decoder.decode_bin(buf[132:136])
-            extdh['historic_zeroing_length'] = Decoder.decode_bin(buf[136:140])
+            extdh['historic_range'] = v[30]
+            extdh['historic_taper_length_2_exponent'] = v[31]
+            extdh['historic_threshold_init_value'] = v[33]
+            extdh['historic_zeroing_length'] = v[34]
         elif _net == 4:
             # Enhanced Diversity Stack
             extdh['window_length'] = _value1
             extdh['overlap'] = _value2
-        extdh['noisy_trace_percentage'] = Decoder.decode_bin(buf[116:120])
-        _thv = Decoder.decode_bin(buf[128:132])
+        extdh['noisy_trace_percentage'] = v[29]
+        _thv = v[32]
         # extdh['threshold_hold/var'] = _threshold_types.get(_thv, None)
-        _top = Decoder.decode_bin(buf[140:144])
+        _top = v[35]
         # extdh['type_of_process'] = _process_types.get(_top, None)
-        extdh['acquisition_type_tables'] = \
-            [Decoder.decode_bin(buf[144 + n * 4:144 + (n + 1) * 4]) for n in range(32)]
-        extdh['threshold_type_tables'] = \
-            [Decoder.decode_bin(buf[272 + n * 4:272 + (n + 1) * 4]) for n in range(32)]
-        extdh['stacking_fold'] = Decoder.decode_bin(buf[400:404])
+        extdh['acquisition_type_tables'] = list(v[36:68])
+        extdh['threshold_type_tables'] = list(v[68:100])
+        extdh['stacking_fold'] = v[100]
         # 404-483 : not used
-        extdh['record_length_in_ms'] = Decoder.decode_bin(buf[484:488])
-        extdh['autocorrelation_peak_time_in_ms'] = Decoder.decode_bin(buf[488:492])
+        extdh['record_length_in_ms'] = v[101]
+        extdh['autocorrelation_peak_time_in_ms'] = v[102]
         # 492-495 : not used
-        extdh['correlation_pilot_number'] = Decoder.decode_bin(buf[496:500])
-        extdh['pilot_length_in_ms'] = Decoder.decode_bin(buf[500:504])
-        extdh['sweep_length_in_ms'] = Decoder.decode_bin(buf[504:508])
-        extdh['acquisition_number'] = Decoder.decode_bin(buf[508:512])
-        extdh['max_of_max_aux'] = Decoder.decode_flt(buf[512:516])
-        extdh['max_of_max_seis'] = Decoder.decode_flt(buf[516:520])
-        extdh['dump_stacking_fold'] = Decoder.decode_bin(buf[520:524])
-        extdh['tape_label'] = Decoder.decode_asc(buf[524:540])
-        extdh['tape_number'] = Decoder.decode_bin(buf[540:544])
-        extdh['software_version'] = Decoder.decode_asc(buf[544:560])
-        extdh['date'] = Decoder.decode_asc(buf[560:572])
-        extdh['source_easting'] = Decoder.decode_dbl(buf[572:580])
-        extdh['source_northing'] = Decoder.decode_dbl(buf[580:588])
-        extdh['source_elevation'] = Decoder.decode_flt(buf[588:592])
-        extdh['slip_sweep_mode_used'] = Decoder.decode_bin_bool(buf[592:596])
-        extdh['files_per_tape'] = Decoder.decode_bin(buf[596:600])
-        extdh['file_count'] = Decoder.decode_bin(buf[600:604])
-        extdh['acquisition_error_description'] = Decoder.decode_asc(buf[604:764])
-        _ft = Decoder.decode_bin(buf[764:768])
+        extdh['correlation_pilot_number'] = v[103]
+        extdh['pilot_length_in_ms'] = v[104]
+        extdh['sweep_length_in_ms'] = v[105]
+        extdh['acquisition_number'] = v[106]
+        extdh['max_of_max_aux'] = v[107]
+        extdh['max_of_max_seis'] = v[108]
+        extdh['dump_stacking_fold'] = v[109]
+        extdh['tape_label'] = _asc(v[110])
+        extdh['tape_number'] = v[111]
+        extdh['software_version'] = _asc(v[112])
+        extdh['date'] = _asc(v[113])
+        extdh['source_easting'] = v[114]
+        extdh['source_northing'] = v[115]
+        extdh['source_elevation'] = v[116]
+        extdh['slip_sweep_mode_used'] = v[117] != 0
+        extdh['files_per_tape'] = v[118]
+        extdh['file_count'] = v[119]
+        extdh['acquisition_error_description'] = _asc(v[120])
+        _ft = v[121]
         # extdh['filter_type'] = _filter_types.get(_ft, None)
-        extdh['stack_is_dumped'] = Decoder.decode_bin_bool(buf[768:772])
-        _ss = Decoder.decode_bin(buf[772:776])
+        extdh['stack_is_dumped'] = v[122] != 0
+        _ss = v[123]
         if _ss == 2:
             _ss = -1
         extdh['stack_sign'] = _ss
-        extdh['PRM_tilt_correction_used'] = Decoder.decode_bin_bool(buf[776:780])
-        extdh['swath_name'] = Decoder.decode_asc(buf[780:844])
-        _om = Decoder.decode_bin(buf[844:848])
+        extdh['PRM_tilt_correction_used'] = v[124] != 0
+        extdh['swath_name'] = _asc(v[125])
+        _om = v[126]
         # XXX: here I suppose that several operating modes are possible
         _op_mode = []
         # for key in _operating_modes:
@@ -317,14 +581,13 @@ class SegDParser:
         #         continue
         extdh['operating_mode'] = _op_mode
         # 848-851 : reserved
-        extdh['no_log'] = Decoder.decode_bin_bool(buf[852:856])
-        extdh['listening_time_in_ms'] = Decoder.decode_bin(buf[856:860])
-        _tod = Decoder.decode_bin(buf[860:864])
+        extdh['no_log'] = v[127] != 0
+        extdh['listening_time_in_ms'] = v[128]
+        _tod = v[129]
         # extdh['type_of_dump'] = _dump_types[_tod]
         # 864-867 : reserved
-        extdh['swath_id'] = Decoder.decode_bin(buf[868:872])
-        extdh['seismic_trace_offset_removal_is_disabled'] = \
-            Decoder.decode_bin_bool(buf[872:876])
+        extdh['swath_id'] = v[130]
+        extdh['seismic_trace_offset_removal_is_disabled'] = v[131] != 0
         # _gps_microseconds = unpack('>Q', buf[876:884])[0]
         # _gps_time = UTCDateTime('19800106') + _gps_microseconds / 1e6
         # _gps_time includes leap seconds (17 as for November 2016)
@@ -335,209 +598,162 @@ class SegDParser:
 
     def _read_external_header(self, size):
         """Read external header."""
-        buf = self._byte_stream.read(size)
-        self.header_block.extend(bytearray(buf))
-
-        return Decoder.decode_asc(buf)
-
-    def _read_traceh(self):
-        """Read trace header."""
-        buf = self._byte_stream.read(20)
-        self.traceh_list.append(bytearray(buf))
-
-        traceh = OrderedDict()
-        _fn = Decoder.decode_bcd(buf[0:2])
-        if _fn == 0xFFFF:
-            _fn = None
-        traceh['file_number'] = _fn
-        traceh['scan_type_number'] = Decoder.decode_bcd(buf[2:3])
-        traceh['channel_set_number'] = Decoder.decode_bcd(buf[3:4])
-        traceh['trace_number'] = Decoder.decode_bcd(buf[4:6])
-        traceh['first_timing_word_in_ms'] = Decoder.decode_bin(buf[6:9]) * 1. / 256
-        traceh['trace_header_extension'] = Decoder.decode_bin(buf[9:10])
-        traceh['sample_skew'] = Decoder.decode_bin(buf[10:11])
-        traceh['trace_edit'] = Decoder.decode_bin(buf[11:12])
-        traceh['time_break_window'] = Decoder.decode_bin(buf[12:14])
-        traceh['time_break_window'] += Decoder.decode_bin(buf[14:15]) / 100.
-        traceh['extended_channel_set_number'] = Decoder.decode_bin(buf[15:16])
-        traceh['extended_file_number'] = Decoder.decode_bin(buf[17:20])
-        return traceh
-
-    def _read_traceh_eb1(self):
-        """Read trace header extension block #1, SEGD standard."""
-        buf = self._byte_stream.read(32)
-        self.traceh_list[-1].extend(bytearray(buf))
-
-        traceh = OrderedDict()
-        _rln = Decoder.decode_bin(buf[0:3])
-        if _rln == 0xFFFFFF:
-            _rln = None
-        traceh['receiver_line_number'] = _rln
-        _rpn = Decoder.decode_bin(buf[3:6])
-        if _rpn == 0xFFFFFF:
-            _rpn = None
-        traceh['receiver_point_number'] = _rpn
-        traceh['receiver_point_index'] = Decoder.decode_bin(buf[6:7])
-        traceh['number_of_samples_per_trace'] = Decoder.decode_bin(buf[7:10])
-        return traceh
-
-    def _read_traceh_eb2(self):
-        """Read trace header extension block #2, SERCEL format."""
-        buf = self._byte_stream.read(32)
-        self.traceh_list[-1].extend(bytearray(buf))
-
-        traceh = OrderedDict()
-        traceh['receiver_point_easting'] = Decoder.decode_dbl(buf[0:8])
-        traceh['receiver_point_northing'] = Decoder.decode_dbl(buf[8:16])
-        traceh['receiver_point_elevation'] = Decoder.decode_flt(buf[16:20])
-        traceh['sensor_type_number'] = Decoder.decode_bin(buf[20:21])
-        # 21-23 : not used
-        traceh['DSD_identification_number'] = Decoder.decode_bin(buf[24:28])
-        traceh['extended_trace_number'] = Decoder.decode_bin(buf[28:32])
-        return traceh
-
-    def _read_traceh_eb3(self):
-        """Read trace header extension block #3, SERCEL format."""
-        buf = self._byte_stream.read(32)
-        self.traceh_list[-1].extend(bytearray(buf))
-
-        traceh = OrderedDict()
-        traceh['resistance_low_limit'] = Decoder.decode_flt(buf[0:4])
-        traceh['resistance_high_limit'] = Decoder.decode_flt(buf[4:8])
-        traceh['resistance_calue_in_ohms'] = Decoder.decode_flt(buf[8:12])
-        traceh['tilt_limit'] = Decoder.decode_flt(buf[12:16])
-        traceh['tilt_value'] = Decoder.decode_flt(buf[16:20])
-        traceh['resistance_error'] = Decoder.decode_bin_bool(buf[20:21])
-        traceh['tilt_error'] = Decoder.decode_bin_bool(buf[21:22])
-        # 22-31 : not used
-        return traceh
+        buf = self._read(size)
+        self._header_chunks.append(buf)
 
-    def _read_traceh_eb4(self):
-        """Read trace header extension block #4, SERCEL format."""
-        buf = self._byte_stream.read(32)
-        self.traceh_list[-1].extend(bytearray(buf))
-
-        traceh = OrderedDict()
-        traceh['capacitance_low_limit'] = Decoder.decode_flt(buf[0:4])
-        traceh['capacitance_high_limit'] = Decoder.decode_flt(buf[4:8])
-        traceh['capacitance_value_in_nano_farads'] = Decoder.decode_flt(buf[8:12])
-        traceh['cutoff_low_limit'] = Decoder.decode_flt(buf[12:16])
-        traceh['cutoff_high_limit'] = Decoder.decode_flt(buf[16:20])
-        traceh['cutoff_value_in_Hz'] = Decoder.decode_flt(buf[20:24])
-        traceh['capacitance_error'] = Decoder.decode_bin_bool(buf[24:25])
-        traceh['cutoff_error'] = Decoder.decode_bin_bool(buf[25:26])
-        # 26-31 : not used
-        return traceh
-
-    def _read_traceh_eb5(self):
-        """Read trace header extension block #5, SERCEL format."""
-        buf = self._byte_stream.read(32)
-        self.traceh_list[-1].extend(bytearray(buf))
-
-        traceh = OrderedDict()
-        traceh['leakage_limit'] = Decoder.decode_flt(buf[0:4])
-        traceh['leakage_value_in_megahoms'] = Decoder.decode_flt(buf[4:8])
-        traceh['instrument_longitude'] = Decoder.decode_dbl(buf[8:16])
-        traceh['instrument_latitude'] = Decoder.decode_dbl(buf[16:24])
-        traceh['leakage_error'] = Decoder.decode_bin_bool(buf[24:25])
-        traceh['instrument_horizontal_position_accuracy_in_mm'] = \
-            Decoder.decode_bin(buf[25:28])
-        traceh['instrument_elevation_in_mm'] = Decoder.decode_flt(buf[28:32])
-        return traceh
-
-    def _read_traceh_eb6(self):
-        """Read trace header extension block #6, SERCEL format."""
-        buf = self._byte_stream.read(32)
-        self.traceh_list[-1].extend(bytearray(buf))
-
-        traceh = OrderedDict()
-        _ut = Decoder.decode_bin(buf[0:1])
-        # traceh['unit_type'] = _unit_types[_ut]
-        traceh['unit_serial_number'] = Decoder.decode_bin(buf[1:4])
-        traceh['channel_number'] = Decoder.decode_bin(buf[4:5])
-        # 5-7 : not used
-        traceh['assembly_type'] = Decoder.decode_bin(buf[8:9])
-        traceh['assembly_serial_number'] = Decoder.decode_bin(buf[9:12])
-        traceh['location_in_assembly'] = Decoder.decode_bin(buf[12:13])
-        # 13-15 : not used
-        _st = Decoder.decode_bin(buf[16:17])
-        # traceh['subunit_type'] = _subunit_types[_st]
-        _ct = Decoder.decode_bin(buf[17:18])
-        # traceh['channel_type'] = _channel_types[_ct]
-        # 18-19 : not used
-        traceh['sensor_sensitivity_in_mV/m/s/s'] = Decoder.decode_flt(buf[20:24])
-        # 24-31 : not used
-        return traceh
-
-    def _read_traceh_eb7(self):
-        """Read trace header extension block #7, SERCEL format."""
-        buf = self._byte_stream.read(32)
-        self.traceh_list[-1].extend(bytearray(buf))
-
-        traceh = OrderedDict()
-        _cut = Decoder.decode_bin(buf[0:1])
-        # traceh['control_unit_type'] = _control_unit_types[_cut]
-        # traceh['control_unit_serial_number'] = Decoder.decode_bin(buf[1:4])
-        # traceh['channel_gain_scale'] = Decoder.decode_bin(buf[4:5])
-        # traceh['channel_filter'] = Decoder.decode_bin(buf[5:6])
-        # traceh['channel_data_error_overscaling'] = Decoder.decode_bin(buf[6:7])
-        # _ces = Decoder.decode_bin(buf[7:8])
-        # traceh['channel_edited_status'] = _channel_edited_statuses[_ces]
-        # traceh['channel_sample_to_mV_conversion_factor'] = Decoder.decode_flt(buf[8:12])
-        # traceh['number_of_stacks_noisy'] = Decoder.decode_bin(buf[12:13])
-        # traceh['number_of_stacks_low'] = Decoder.decode_bin(buf[13:14])
-        # _channel_type_ids = {1: 'seis', 9: 'aux'}
-        # _cti = Decoder.decode_bin(buf[14:15])
-        # traceh['channel_type_id'] = _channel_type_ids[_cti]
-        # _cp = Decoder.decode_bin(buf[15:16])
-        # traceh['channel_process'] = _channel_processes[_cp]
-        traceh['trace_max_value'] = Decoder.decode_flt(buf[16:20])
-        traceh['trace_max_time_in_us'] = Decoder.decode_bin(buf[20:24])
-        traceh['number_of_interpolations'] = Decoder.decode_bin(buf[24:28])
-        traceh['seismic_trace_offset_value'] = Decoder.decode_bin(buf[28:32])
-        return traceh
+        return _asc(buf)
 
     def _read_trace_data(self, size):
-        buf = array('f')
-        # buf.fromfile(fp, size) doesn't work with py2
-        tmp = self._byte_stream.read(size * 4)
-        buf.fromstring(tmp)
-        buf.byteswap()
-        buf = np.array(buf, dtype=np.float32)
-        return buf
-
-    def _read_trace_data_block(self, size):
-        traceh = self._read_traceh()
-        th_ext = traceh['trace_header_extension']
-
-        _read_traceh_eb = [self._read_traceh_eb1, self._read_traceh_eb2,
-                           self._read_traceh_eb3, self._read_traceh_eb4,
-                           self._read_traceh_eb5, self._read_traceh_eb6,
-                           self._read_traceh_eb7]
-
+        pos = self._pos
+        self._pos = pos + size * 4
+        # decoded straight from the map, the returned samples are a copy
+        if self._gain is None:
+            return Decoder.decode_flt_array(self._mm, size, pos)
+        return Decoder.decode_and_scale(self._mm, self._gain, size, pos)
+
+    def _read_all_trace_blocks(self, n_traces, size):
+        """
+        Decode the samples of all traces at once from the mapped file, along with their trace
+        headers, which are stored in traceh.
+
+        The trace blocks are viewed as rows of a 2D array, which requires every trace header
+        to have the same number of extension blocks. Returns None when they vary or the file
+        is truncated, the cursor is left unchanged.
+        """
+        base = self._pos
+        if n_traces == 0 or len(self._mm) - base < 20:
+            return None
+        th_ext = self._mm[base + 9]
+        if th_ext > len(_TRACEH_EB_FIELDS):
+            raise SEGDNotImplemented('Only trace header extension blocks #1 ... #7 are supported')
+        record_stride = 20 + 32 * th_ext + size * 4
+        if len(self._mm) - base < n_traces * record_stride:
+            return None
+        raw = np.frombuffer(self._mm, dtype=np.uint8, count=n_traces * record_stride,
+                            offset=base).reshape(n_traces, record_stride)
+        if np.any(raw[:, 9] != th_ext):
+            return None
+        samples = raw[:, record_stride - size * 4:].view(np.dtype('>f4'))
+        if self._sample_dtype == 'int16':
+            # quantized trace by trace, the float32 samples are never held for the whole file
+            data = np.empty((n_traces, size), dtype=np.int16, order='C')
+            self.trace_gains = np.empty(n_traces, dtype=np.float32)
+            trace = np.empty(size, dtype=np.float32)
+            scratch = np.empty(size, dtype=np.float32)
+            gain = np.float32(1 if self._gain is None else self._gain)
+            for n in range(n_traces):
+                np.multiply(samples[n], gain, out=trace, dtype=np.float32)
+                self.trace_gains[n] = self._quantize_trace(trace, data[n], scratch)
+        # a row-major copy, the samples of each trace contiguous
+        elif self._gain is None:
+            data = samples.astype(np.float32, order='C')
+        else:
+            # byteswap and scale in the same ufunc pass
+            data = np.empty((n_traces, size), dtype=np.float32, order='C')
+            np.multiply(samples, np.float32(self._gain), out=data, dtype=np.float32)
+        self._decode_traceh_columns(raw, th_ext)
+        return data
+
+    def _decode_traceh_columns(self, raw, th_ext):
+        """Decode the trace headers of the rows of raw into traceh, one column per field."""
+        fields = list(_TRACEH_FIELDS)
         for n in range(th_ext):
-            traceh.update(_read_traceh_eb[n]())
+            # the trace header is 20 bytes, each extension block 32
+            fields.extend((key, 20 + 32 * n + off, ln, 'bin' if typ == 'bool' else typ)
+                          for key, off, ln, typ in _TRACEH_EB_FIELDS[n])
+        out_int, out_flt = Decoder.decode_headers(raw[:, :20 + 32 * th_ext],
+                                                  [f[1:] for f in fields])
+        columns = {key: out_int[:, j] if typ in ('bin', 'bcd') else out_flt[:, j]
+                   for j, (key, _, _, typ) in enumerate(fields)}
+        columns['first_timing_word_in_ms'] = columns['first_timing_word_in_ms'] / 256
+        columns['time_break_window'] = (columns['time_break_window'] +
+                                        columns.pop('time_break_window_fraction') / 100.)
+        for key, col in columns.items():
+            self.traceh[key] = col
+
+    def _read_trace_headers(self):
+        """Read a trace header and its extension blocks."""
+        # the number of extension blocks selects the reader unrolled for it
+        th_ext = self._mm[self._pos + 9]
+        return _trace_headers_reader(th_ext)(self)
 
+    def _read_trace_data_block(self, size):
+        traceh = self._read_trace_headers()
         data = self._read_trace_data(size)
         return traceh, data
 
-    def _build_segd_header(self, generalh, sch, extdh, extrh, traceh):
-        segd = OrderedDict()
-        segd.update(generalh)
-        channel_set_number = traceh['channel_set_number']
-        segd.update(sch[channel_set_number])
-        segd.update(extdh)
-        segd['external_header'] = extrh
+    def _store_traceh(self, n, traceh):
+        """Store the decoded header of trace n in the traceh record array."""
+        for key, val in traceh.items():
+            if val is None:
+                val = _TRACEH_UNDEFINED[key]
+            self.traceh[key][n] = val
+
+    def get_traceh(self, i):
+        """Trace header of trace i as a dict, built from its traceh record."""
+        rec = self.traceh[i]
+        keys = _TRACEH_KEYS + sum(_TRACEH_EB_KEYS[:rec['trace_header_extension']], ())
+        traceh = OrderedDict()
+        for key in keys:
+            val = rec[key].item()
+            if val == _TRACEH_UNDEFINED.get(key):
+                val = None
+            traceh[key] = val
+        return traceh
+
+    def segd_header(self, i):
+        """Full SEG-D header of trace i: general, scan type, extended, external and trace headers."""
+        traceh = self.get_traceh(i)
+        segd = OrderedDict(self._segd_base[traceh['channel_set_number']])
         segd.update(traceh)
         return segd
 
+    def _build_segd_base(self, generalh, sch, extdh, extrh):
+        """Merge the headers shared by the traces of each channel set, keyed by channel set number."""
+        segd_base = {}
+        for channel_set_number, _sch in sch.items():
+            segd = OrderedDict()
+            segd.update(generalh)
+            segd.update(_sch)
+            segd.update(extdh)
+            segd['external_header'] = extrh
+            segd_base[channel_set_number] = segd
+        return segd_base
+
     def _print_dict(self, dict, title):
         print(title)
         for key, val in dict.items():
             print('{}: {}'.format(key, val))
 
     def read_segd(self):
-        self._byte_stream = open(self._filepath, 'rb')
+        fd = os.open(self._filepath, os.O_RDONLY)
+        try:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            self._mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        # the file is parsed front to back: ask for aggressive readahead, and for the first
+        # pages to be read in while the headers are parsed (madvise needs Python 3.8+)
+        if hasattr(self._mm, 'madvise'):
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                self._mm.madvise(mmap.MADV_SEQUENTIAL)
+            if hasattr(mmap, 'MADV_WILLNEED'):
+                self._mm.madvise(mmap.MADV_WILLNEED, 0, min(len(self._mm), _PREFETCH_SIZE))
+        self._pos = 0
+        try:
+            self._read_segd()
+        except BaseException:
+            try:
+                self._mm.close()
+            except BufferError:
+                # views of the map are still held by the traceback frames, it is released
+                # with them; don't hide the original error
+                pass
+            raise
+        self._mm.close()
+
+    def _read_segd(self):
         generalh = self._read_general_hdr1()
         generalh.update(self._read_general_hdr2())
         generalh.update(self._read_general_hdr3())
@@ -555,77 +771,182 @@ class SegDParser:
             ext_hdr_lng = generalh['external_header_blocks']
         size = ext_hdr_lng * 32
         extrh = self._read_external_header(size)
-        sample_rate = extdh['sample_rate_in_us'] / 1e6
+        self.header_block = bytearray().join(self._header_chunks)
+        self._header_chunks = []
         npts = extdh['number_of_samples_in_trace']
         size = npts
-        st = Stream()
-        convert_to_int = True
-        for n in range(extdh['total_number_of_traces']):
-            traceh, data = self._read_trace_data_block(size)
-            # check if all traces can be converted to int
-            convert_to_int = convert_to_int and np.all(np.mod(data, 1) == 0)
-            # _print_dict(traceh, '***TRACEH:')
-            tr = Trace(data)
-            # tr.stats.station = str(traceh['unit_serial_number'])
-            tr.stats.channel = Decoder.band_code(1. / sample_rate)
-            # tr.stats.channel += _instrument_orientation_code[traceh['sensor_code']]
-            tr.stats.delta = sample_rate
-            tr.stats.starttime = generalh['time']
-            tr.stats.segd = self._build_segd_header(generalh, sch, extdh, extrh, traceh)
-            st.append(tr)
-        self._byte_stream.close()
-        self.traces_data = np.zeros((extdh['total_number_of_traces'], extdh['number_of_samples_in_trace']))
-        for i in range(len(st)):
-            self.traces_data[i, :] = np.asarray(st[i].data)
+        self._generalh = generalh
+        self._extdh = extdh
+        self._segd_base = self._build_segd_base(generalh, sch, extdh, extrh)
+        n_traces = extdh['total_number_of_traces']
+        self.traceh = np.zeros(n_traces, dtype=TRACE_HEADER_DTYPE).view(np.recarray)
+        self.traces_data = self._read_all_trace_blocks(n_traces, size)
+        if self.traces_data is None:
+            quantize = self._sample_dtype == 'int16'
+            self.traces_data = np.empty((n_traces, npts), dtype=np.int16 if quantize else np.float32,
+                                        order='C')
+            if quantize:
+                self.trace_gains = np.empty(n_traces, dtype=np.float32)
+                scratch = np.empty(npts, dtype=np.float32)
+            for n in range(n_traces):
+                traceh, data = self._read_trace_data_block(size)
+                self._store_traceh(n, traceh)
+                # _print_dict(traceh, '***TRACEH:')
+                if quantize:
+                    self.trace_gains[n] = self._quantize_trace(data, self.traces_data[n], scratch)
+                else:
+                    self.traces_data[n, :] = data
+        else:
+            # samples and traceh already decoded, only the raw headers are kept
+            for n in range(n_traces):
+                th_ext = int(self.traceh.trace_header_extension[n])
+                self.traceh_list.append(bytearray(self._read(20 + 32 * th_ext)))
+                self._pos += size * 4
         # for n, _sch in sch.iteritems():
         #     _print_dict(_sch, '***SCH %d:' % n)
         # _print_dict(extdh, '***EXTDH:')
         # print('***EXTRH:\n %s' % extrh)
         # _print_dict(generalh, '***GENERALH:')
+        if self._sample_dtype == 'int16':
+            return
+        # convert to int if all samples are integral, checked trace by trace up to the first
+        # trace that is not; NaN and out of range samples cast to garbage and so fail the comparison
+        with np.errstate(invalid='ignore'):
+            convert_to_int = all(np.array_equal(trace.astype(np.int32), trace)
+                                 for trace in self.traces_data)
         if convert_to_int:
-            for tr in st:
-                tr.data = tr.data.astype(np.int32)
-        # return st
+            self.traces_data = self.traces_data.astype(np.int32, order='C')
+
+    @staticmethod
+    def _quantize_trace(trace, out, scratch):
+        """Quantize the float32 samples of trace into the int16 row out, returns its float32 gain."""
+        # fmax skips NaN samples, which int16 cannot hold and are stored as 0
+        peak = np.fmax.reduce(np.abs(trace, out=scratch), initial=0)
+        gain = peak / np.float32(32767)
+        # all-zero traces
+        if gain == 0:
+            gain = np.float32(1)
+        np.rint(np.divide(trace, gain, out=scratch), out=scratch)
+        scratch[np.isnan(scratch)] = 0
+        out[:] = scratch
+        return gain
+
+    def decoded_trace(self, i):
+        """Amplitudes of trace i in float32, upcast from int16 if traces_data is quantized."""
+        if self._sample_dtype == 'int16':
+            return self.traces_data[i] * self.trace_gains[i]
+        return self.traces_data[i].astype(np.float32)
+
+    def to_stream(self):
+        """ObsPy Stream of the parsed traces, with the full SEG-D header of each in stats.segd."""
+        # the same for every trace of the record
+        sample_rate = self._extdh['sample_rate_in_us'] / 1e6
+        channel = Decoder.band_code(1. / sample_rate)
+        starttime = self._generalh['time']
+        st = Stream()
+        for i in range(len(self.traces_data)):
+            # quantized traces are upcast, the others are passed as views of traces_data
+            data = self.decoded_trace(i) if self._sample_dtype == 'int16' else self.traces_data[i]
+            hdr = {'channel': channel, 'delta': sample_rate, 'starttime': starttime,
+                   'segd': self.segd_header(i)}
+            st.append(Trace(data, header=hdr))
+        return st
 
     def path_leaf(self):
         head, tail = os.path.split(self._filepath)
         return tail or os.path.basename(head)
 
-    def save_parsed_files(self, output_dir=''):
+    def save_parsed_files(self, output_dir='', binary=True):
+        """
+        Save the header block, trace headers and trace data of the parsed file.
+
+        Trace data is saved as a binary .npy file, or as text when binary is False.
+        """
         self._segd_dir = os.path.dirname(self._filepath)
         self._segd_filename = self.path_leaf()
+        self._stem = self._segd_filename.rsplit('.', 1)[0]
 
         if output_dir == '':
-            self._output_dir = os.path.join(self._segd_dir, 'parsed', self._segd_filename.split('.')[0])
+            self._output_dir = os.path.join(self._segd_dir, 'parsed', self._stem)
         else:
-            self._output_dir = os.path.join(output_dir, self._segd_filename.split('.')[0])
+            self._output_dir = os.path.join(output_dir, self._stem)
 
         # Create output dir
         Path(self._output_dir).mkdir(parents=True, exist_ok=True)
 
-        self.write_header_block()
-        self.write_trace_headers()
-        self.write_trace_data()
-        print(f'Saved {self.path_leaf()} to {self._output_dir}')
-
-    def write_header_block(self):
-        header_block_filepath = os.path.join(self._output_dir, self._segd_filename.split('.')[0]) + '.hdr_block'
+        # the writers go to separate files, run them concurrently to overlap their IO; their
+        # messages are printed once all are done, so that the threads don't interleave them
+        write_trace_data = self.write_trace_data_binary if binary else self.write_trace_data
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(self.write_header_block, quiet=True),
+                       executor.submit(self.write_trace_headers, quiet=True),
+                       executor.submit(write_trace_data, quiet=True)]
+        for future in futures:
+            # re-raises the errors of the writers
+            print(future.result())
+        print(f'Saved {self._segd_filename} to {self._output_dir}')
+
+    @staticmethod
+    def _report(message, quiet):
+        """Print the message of a writer unless quiet, and return it."""
+        if not quiet:
+            print(message)
+        return message
+
+    def write_header_block(self, quiet=False):
+        header_block_filepath = os.path.join(self._output_dir, self._stem) + '.hdr_block'
         with open(header_block_filepath, 'wb') as f:
             f.write(self.header_block)
-        print(f'Wrote header block of {self.path_leaf()} to {header_block_filepath}')
-
-    def write_trace_headers(self):
+        return self._report(f'Wrote header block of {self._segd_filename} to {header_block_filepath}', quiet)
+
+    def write_trace_headers(self, quiet=False):
+        """
+        Write the trace headers of all traces to a single .trace_headers file.
+
+        The headers of trace i are at offset i * stride, padded with zeros to the longest header.
+        The .trace_headers.index text file lists the number and header length of each trace.
+        """
+        trace_headers_filepath = os.path.join(self._output_dir, self._stem) + '.trace_headers'
+        stride = max((len(h) for h in self.traceh_list), default=0)
+        blob = bytearray(len(self.traceh_list) * stride)
+        for i, h in enumerate(self.traceh_list):
+            blob[i * stride:i * stride + len(h)] = h
+        with open(trace_headers_filepath, 'wb') as f:
+            f.write(blob)
+        with open(trace_headers_filepath + '.index', 'w') as f:
+            f.write(f'stride {stride}\n')
+            f.writelines(f'{i + 1} {len(h)}\n' for i, h in enumerate(self.traceh_list))
+        return self._report(f'Wrote traces headers of {self._segd_filename} to {trace_headers_filepath}', quiet)
+
+    def write_trace_headers_separate(self, quiet=False):
+        """Write the trace headers of each trace to its own file in the trace_headers dir."""
         traces_headers_dir = os.path.join(self._output_dir, 'trace_headers')
         Path(traces_headers_dir).mkdir(parents=True, exist_ok=True)
+        trace_filepath_prefix = os.path.join(traces_headers_dir, self._stem)
         for i in range(len(self.traceh_list)):
-            trace_filepath = os.path.join(traces_headers_dir,
-                                          self._segd_filename.split('.')[0]) + f'.trace_{i + 1}.headers'
+            trace_filepath = f'{trace_filepath_prefix}.trace_{i + 1}.headers'
             with open(trace_filepath, 'wb') as f:
                 f.write(self.traceh_list[i])
-        print(f'Wrote traces headers of {self.path_leaf()} to {traces_headers_dir}')
-
-    def write_trace_data(self):
-        trace_data_filepath = os.path.join(self._output_dir, self._segd_filename.split('.')[0]) + '.trace_data'
-        np.set_printoptions(threshold=sys.maxsize, suppress=True, formatter={'float_kind': '{:0.16f}'.format})
-        np.savetxt(trace_data_filepath, self.traces_data, fmt='%0.16f')
-        print(f'Wrote traces data of {self.path_leaf()} with shape: {self.traces_data.shape} to {trace_data_filepath}')
+        return self._report(f'Wrote traces headers of {self._segd_filename} to {traces_headers_dir}', quiet)
+
+    def _amplitudes(self):
+        """traces_data, upcast by the trace gains if it is quantized."""
+        if self._sample_dtype == 'int16':
+            return self.traces_data * self.trace_gains[:, np.newaxis]
+        return self.traces_data
+
+    def write_trace_data(self, quiet=False):
+        trace_data_filepath = os.path.join(self._output_dir, self._stem) + '.trace_data'
+        # same layout as np.savetxt(fmt='%0.16f'), formatted by tofile's C loop
+        with open(trace_data_filepath, 'w') as f:
+            for trace in self._amplitudes():
+                trace.tofile(f, sep=' ', format='%0.16f')
+                f.write('\n')
+        message = f'Wrote traces data of {self._segd_filename} with shape: {self.traces_data.shape}'
+        return self._report(f'{message} to {trace_data_filepath}', quiet)
+
+    def write_trace_data_binary(self, quiet=False):
+        trace_data_filepath = os.path.join(self._output_dir, self._stem) + '.trace_data.npy'
+        np.save(trace_data_filepath, self._amplitudes())
+        message = f'Wrote traces data of {self._segd_filename} with shape: {self.traces_data.shape}'
+        return self._report(f'{message} to {trace_data_filepath}', quiet)